@@ -1,14 +1,50 @@
+import json
+
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 
-from db.blocks import get_all_blocks
+from db.blocks import get_blocks_page
 
 router = APIRouter(prefix="/blocks")
 
+# 每次从数据库读取并向客户端写出的区块条数
+_EXPORT_BATCH = 500
+
+
+def _iter_export():
+    """
+    逐批生成 {"blocks": [...]} 的 JSON 文本
+
+    同步生成器：StreamingResponse 会在线程池中迭代，数据库读取不阻塞事件循环。
+    按 block_index 做 keyset 分页，每批用一次短连接读取，yield 期间不占用连接，
+    客户端下载再慢也不会拖住连接池
+    """
+    dumps = json.JSONEncoder(
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode
+
+    yield '{"blocks":['
+    sep = ""
+    last_index = -1
+    while True:
+        blocks = get_blocks_page(last_index, _EXPORT_BATCH)
+        if not blocks:
+            break
+        yield sep + ",".join(map(dumps, blocks))
+        sep = ","
+        last_index = blocks[-1]["block_index"]
+        if len(blocks) < _EXPORT_BATCH:
+            break
+    yield "]}"
+
 
 @router.get("/export")
 async def export_blocks():
     """
     导出区块链全部数据（原始 blocks 表）
+
+    流式输出，内存占用与链长度无关，响应格式不变：{"blocks": [...]}
     """
-    blocks = get_all_blocks()
-    return {"blocks": blocks}
+    return StreamingResponse(_iter_export(), media_type="application/json")
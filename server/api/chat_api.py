@@ -1,10 +1,20 @@
 # backend/api/chat_api.py
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from services import chat_service
 from db.trades import get_trade
+import asyncio
 import json
+import logging
 import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Python 3.11+ 才有 asyncio.timeout
+_asyncio_timeout = getattr(asyncio, "timeout", None)
 
 router = APIRouter(prefix="/ws/chat")
 http_router = APIRouter(prefix="/chat")
@@ -12,6 +22,63 @@ http_router = APIRouter(prefix="/chat")
 # WebSocket连接管理
 active_connections = {}
 
+
+# -----------------------------
+# 聊天消息处理（按 type 分发）
+# -----------------------------
+
+# 认证成功响应的文本帧模板（与 send_json 的输出一致），只需代入 trade_id 与时间戳；
+# trade_id 来自 URL，先经 json.dumps 转义再代入
+_AUTH_OK_TEMPLATE = '{"type":"auth_response","success":true,"trade_id":%s,"timestamp":%d}'
+
+# PONG 帧缓存：(秒级时间戳, 文本帧)，事件循环单线程，无需加锁
+_pong_cache = (0, "")
+
+async def _handle_chat(websocket: WebSocket, trade_id: str, identity_pubkey: str, chat_pubkey: str, message: dict):
+    """
+    处理聊天消息
+    """
+    ciphertext = message.get('ciphertext')
+    buyer_chat_pubkey = message.get('buyer_chat_pubkey') or chat_pubkey
+    if ciphertext:
+        # 中继消息
+        await chat_service.relay(
+            trade_id, 
+            ciphertext, 
+            chat_pubkey,
+            buyer_chat_pubkey
+        )
+    else:
+        logger.debug("收到无效的CHAT消息: 缺少ciphertext, trade_id=%s", trade_id)
+
+
+async def _handle_join(websocket: WebSocket, trade_id: str, identity_pubkey: str, chat_pubkey: str, message: dict):
+    """
+    重新广播JOIN消息
+    """
+    await chat_service.broadcast_join(trade_id, identity_pubkey, chat_pubkey)
+
+
+async def _handle_ping(websocket: WebSocket, trade_id: str, identity_pubkey: str, chat_pubkey: str, message: dict):
+    """
+    心跳响应（同一秒内的 PONG 复用已编码好的文本帧）
+    """
+    global _pong_cache
+
+    now = time.time_ns() // 1_000_000_000
+    if _pong_cache[0] != now:
+        _pong_cache = (now, chat_service.dumps_message({"type": "PONG", "timestamp": now}))
+    await websocket.send_text(_pong_cache[1])
+
+
+# 消息类型 -> 处理函数（一次字典查找代替 if/elif 链）
+_MESSAGE_HANDLERS = {
+    "CHAT": _handle_chat,
+    "JOIN": _handle_join,
+    "PING": _handle_ping,
+}
+
+
 @router.websocket("/{trade_id}")
 async def chat_websocket(websocket: WebSocket, trade_id: str):
     """
@@ -19,26 +86,30 @@ async def chat_websocket(websocket: WebSocket, trade_id: str):
     """
     # 1. 接受WebSocket连接
     await websocket.accept()
-    print(f"[chat_api] 新WebSocket连接: trade_id={trade_id}")
+    logger.info("新WebSocket连接: trade_id=%s", trade_id)
     
-    # 2. 验证交易ID是否存在
-    trade = get_trade(trade_id)
+    # 2. 验证交易ID是否存在（缓存未命中时要等连接池，放到线程池里，不阻塞事件循环）
+    trade = await run_in_threadpool(get_trade, trade_id)
     if trade is None:
-        print(f"[chat_api] 交易不存在: trade_id={trade_id}")
+        logger.info("交易不存在: trade_id=%s", trade_id)
         await websocket.close(code=1008, reason="Trade not found")
         return
     
     # 3. 等待认证消息
     try:
-        # 设置接收超时
-        import asyncio
+        # 设置接收超时（asyncio.timeout 只挂一个定时器，不像 wait_for 那样包一层 Task；
+        # Python 3.11 之前没有 asyncio.timeout，退回 wait_for）
         try:
-            data = await asyncio.wait_for(websocket.receive_text(), timeout=30.0)
+            if _asyncio_timeout is not None:
+                async with _asyncio_timeout(30.0):
+                    data = await websocket.receive_text()
+            else:
+                data = await asyncio.wait_for(websocket.receive_text(), timeout=30.0)
         except asyncio.TimeoutError:
             await websocket.close(code=1008, reason="Authentication timeout")
             return
         
-        auth_data = json.loads(data)
+        auth_data = chat_service.loads_message(data)
         
         # 验证认证消息
         if auth_data.get('type') != 'auth':
@@ -55,59 +126,33 @@ async def chat_websocket(websocket: WebSocket, trade_id: str):
             await websocket.close(code=1008, reason="Missing chat_pubkey")
             return
         
-        print(f"[chat_api] 用户认证成功: trade_id={trade_id}, identity={identity_pubkey[:16]}...")
+        logger.info("用户认证成功: trade_id=%s, identity=%s...", trade_id, identity_pubkey[:16])
         
         # 4. 加入聊天房间
         await chat_service.join_room(trade_id, websocket, identity_pubkey, chat_pubkey)
-        print(f"[chat_api] 连接已加入房间: trade_id={trade_id}")
+        logger.info("连接已加入房间: trade_id=%s", trade_id)
         
         # 5. 发送认证成功响应
-        await websocket.send_json({
-            "type": "auth_response",
-            "success": True,
-            "trade_id": trade_id,
-            "timestamp": int(time.time())
-        })
+        await websocket.send_text(
+            _AUTH_OK_TEMPLATE % (json.dumps(trade_id, ensure_ascii=False), int(time.time()))
+        )
         
         # 6. 持续接收并转发消息
         while True:
             data = await websocket.receive_text()
             
             try:
-                message = json.loads(data)
+                message = chat_service.loads_message(data)
                 message_type = message.get('type')
                 
-                if message_type == 'CHAT':
-                    # 处理聊天消息
-                    ciphertext = message.get('ciphertext')
-                    buyer_chat_pubkey = message.get('buyer_chat_pubkey') or chat_pubkey
-                    if ciphertext:
-                        # 中继消息
-                        await chat_service.relay(
-                            trade_id, 
-                            ciphertext, 
-                            chat_pubkey,
-                            buyer_chat_pubkey
-                        )
-                    else:
-                        print(f"[chat_api] 收到无效的CHAT消息: 缺少ciphertext")
-                
-                elif message_type == 'JOIN':
-                    # 重新广播JOIN消息
-                    await chat_service.broadcast_join(trade_id, identity_pubkey, chat_pubkey)
-                
-                elif message_type == 'PING':
-                    # 心跳响应
-                    await websocket.send_json({
-                        "type": "PONG",
-                        "timestamp": int(time.time())
-                    })
-                
+                handler = _MESSAGE_HANDLERS.get(message_type)
+                if handler is not None:
+                    await handler(websocket, trade_id, identity_pubkey, chat_pubkey, message)
                 else:
-                    print(f"[chat_api] 未知消息类型: {message_type}")
+                    logger.debug("未知消息类型: %s", message_type)
                     
             except json.JSONDecodeError:
-                print(f"[chat_api] 收到非JSON消息，长度: {len(data)}")
+                logger.debug("收到非JSON消息，长度: %d", len(data))
                 # 尝试作为纯文本密文处理
                 await chat_service.relay(
                     trade_id, 
@@ -116,13 +161,13 @@ async def chat_websocket(websocket: WebSocket, trade_id: str):
                     chat_pubkey
                 )
             except Exception as e:
-                print(f"[chat_api] 处理消息异常: {e}")
+                logger.warning("处理消息异常: %s", e)
                 
     except WebSocketDisconnect:
-        print(f"[chat_api] WebSocket断开: trade_id={trade_id}")
+        logger.info("WebSocket断开: trade_id=%s", trade_id)
         chat_service.leave_room(trade_id, websocket)
     except Exception as e:
-        print(f"[chat_api] WebSocket错误: trade_id={trade_id}, 错误={e}")
+        logger.error("WebSocket错误: trade_id=%s, 错误=%s", trade_id, e)
         chat_service.leave_room(trade_id, websocket)
         try:
             await websocket.close(code=1011, reason="Internal server error")
@@ -130,16 +175,24 @@ async def chat_websocket(websocket: WebSocket, trade_id: str):
             pass
 
 @http_router.get("/history/{trade_id}")
-async def get_chat_history(trade_id: str, limit: int = 100):
+def get_chat_history(
+    trade_id: str,
+    limit: int = 100,
+    after_ts: Optional[int] = None,
+    after_buyer_chat_pubkey: Optional[str] = None,
+):
     """
     获取交易的历史聊天消息
+    翻页时传入上一页最后一条消息的 timestamp / buyer_chat_pubkey
     """
     try:
-        print(f"[chat_api] 获取聊天历史: trade_id={trade_id}")
+        logger.debug("获取聊天历史: trade_id=%s", trade_id)
         
         # 直接获取历史消息，不验证交易ID存在性
-        messages = chat_service.get_chat_history(trade_id, limit)
-        print(f"[chat_api] 获取到 {len(messages)} 条消息")
+        messages = chat_service.get_chat_history(
+            trade_id, limit, after_ts, after_buyer_chat_pubkey
+        )
+        logger.debug("获取到 %d 条消息", len(messages))
         
         # 转换格式
         result = []
@@ -153,11 +206,10 @@ async def get_chat_history(trade_id: str, limit: int = 100):
                 "sender_pubkey": msg.get("sender_pubkey")
             })
         
-        return {"success": True, "messages": result}
+        # 行数据本身就是 JSON 原生类型，直接返回 JSONResponse，跳过 jsonable_encoder
+        return JSONResponse({"success": True, "messages": result})
     except Exception as e:
-        print(f"[chat_api] 获取聊天历史失败: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("获取聊天历史失败: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @http_router.get("/room/{trade_id}")
@@ -174,5 +226,5 @@ async def get_chat_room_info(trade_id: str):
             "count": len(room_info)
         }
     except Exception as e:
-        print(f"[chat_api] 获取房间信息失败: {e}")
+        logger.error("获取房间信息失败: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,6 +1,17 @@
 # backend/api/trade_api.py
 
+import json
+import re
+from threading import Lock
+
 from fastapi import APIRouter, Request, HTTPException, Query
+from fastapi.responses import JSONResponse, ORJSONResponse
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖，未安装时只走标准库 json
+    orjson = None
 
 from services.trade_service import (
     verify_create,
@@ -16,12 +27,90 @@ from db.trades import get_trade, list_trades, count_trades
 router = APIRouter(prefix="/trade")
 
 
+# 19 位及以上的连续数字可能是超出 64 位的整数，orjson 会把它静默解析成 float
+_LONG_DIGITS = re.compile(rb"\d{19,}")
+
+
+async def _read_json(request: Request):
+    """
+    解析请求体 JSON；安装了 orjson 时直接解析原始 bytes
+    （request.json() 固定走标准库 json.loads）
+
+    orjson 与标准库结果可能不同的输入（超长整数、BOM、NaN 等）交给 json.loads，
+    保证解析结果与 request.json() 一致
+    """
+    body = await request.body()
+    data = None
+    if orjson is not None and not _LONG_DIGITS.search(body):
+        try:
+            data = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            pass
+    if data is None:
+        data = json.loads(body)
+
+    # 各接口都按对象取字段，数组 / 标量请求体按无效 JSON 处理
+    if not isinstance(data, dict):
+        raise ValueError("JSON body must be an object")
+    return data
+
+
+# 本模块所有接口返回的内容都已是 JSON 原生类型（str / int / bool / None 及其 dict），
+# 直接序列化，跳过 jsonable_encoder；安装了 orjson 时用 ORJSONResponse
+_DirectJSONResponse = ORJSONResponse if orjson is not None else JSONResponse
+
+# 验签、写链、读写数据库都是阻塞调用，统一放到线程池执行，不占用事件循环：
+# 不需要 await 的接口直接写成 def（FastAPI 自动放进线程池），
+# 需要读取请求体的接口用 run_in_threadpool 包住阻塞部分。
+# 写操作是 “读状态 -> 校验 -> 写入” 的组合，放进线程池后需要互斥，
+# 否则两个请求可能同时通过校验（例如对同一交易重复 complete）
+_write_lock = Lock()
+
+
+def _verify_and_apply(verify, **kwargs):
+    """
+    在 _write_lock 内完成校验和写链（在线程池中调用）
+    校验失败抛出 TradeValidationError，由 app 统一转为 400
+    """
+    with _write_lock:
+        block = verify(**kwargs)
+
+        # 合法才写链
+        apply_block(block)
+
+
+def _check_fields(data: dict, required, optional=()):
+    """
+    必填字段必须是非空字符串（None / 空串都算缺失），可选字段为 None 或字符串，否则 400
+    （畸形输入不能带进验签 / 数据库，在那里变成 500）
+    """
+    for field in required:
+        value = data.get(field)
+        if value is None or value == "":
+            raise HTTPException(status_code=400, detail=f"Missing field: {field}")
+        if not isinstance(value, str):
+            raise HTTPException(status_code=400, detail=f"Invalid field: {field}")
+
+    for field in optional:
+        value = data.get(field)
+        if value is not None and not isinstance(value, str):
+            raise HTTPException(status_code=400, detail=f"Invalid field: {field}")
+
+
+def _locked(func, *args, **kwargs):
+    """
+    在 _write_lock 内执行写操作（在线程池中调用）
+    """
+    with _write_lock:
+        return func(*args, **kwargs)
+
+
 
 # GET —— 获取交易列表------list
 
 
 @router.get("/list")
-async def get_trade_list(
+def get_trade_list(
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=200),
 ):
@@ -31,30 +120,18 @@ async def get_trade_list(
     total = count_trades()
     offset = (page - 1) * page_size
     trades = list_trades(limit=page_size, offset=offset)
-    # 转换数据库格式为 API 格式
-    result = []
-    for trade in trades:
-        result.append({
-            "trade_id": trade["trade_id"],
-            "seller_pubkey": trade["seller_pubkey"],
-            "buyer_pubkey": trade.get("buyer_pubkey"),
-            "status": trade["status"],
-            "description": trade.get("description"),
-            "price": trade.get("price"),
-
-            "content_hash": trade.get("content_hash"),
-            "created_at": trade.get("created_at").isoformat() if trade.get("created_at") else None,
-        })
     total_pages = (total + page_size - 1) // page_size if total > 0 else 0
-    return {
-        "data": result,
+    # list_trades 返回的行与 API 字段一致且全部是 JSON 原生类型（created_at 已是字符串），
+    # 直接返回，跳过 jsonable_encoder 的逐字段遍历
+    return _DirectJSONResponse({
+        "data": trades,
         "page": page,
         "page_size": page_size,
         "total": total,
         "total_pages": total_pages,
         "has_prev": page > 1,
         "has_next": page < total_pages,
-    }
+    })
 
 
 
@@ -62,7 +139,7 @@ async def get_trade_list(
 
 
 @router.get("/{trade_id}")
-async def get_single_trade(trade_id: str):
+def get_single_trade(trade_id: str):
     """
     获取单个交易详情
     """
@@ -70,7 +147,7 @@ async def get_single_trade(trade_id: str):
     if trade is None:
         raise HTTPException(status_code=404, detail="Trade not found")
     
-    return {
+    return _DirectJSONResponse({
         "trade_id": trade["trade_id"],
         "seller_pubkey": trade["seller_pubkey"],
         "buyer_pubkey": trade.get("buyer_pubkey"),
@@ -79,7 +156,7 @@ async def get_single_trade(trade_id: str):
         "price": trade.get("price"),
         "content_hash": trade.get("content_hash"),
         "created_at": trade.get("created_at").isoformat() if trade.get("created_at") else None,
-    }
+    })
 
 
 
@@ -97,7 +174,7 @@ async def create_trade(request: Request):
     """
 
     try:
-        data = await request.json()
+        data = await _read_json(request)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid JSON")
 
@@ -105,6 +182,8 @@ async def create_trade(request: Request):
     if "body" in data:
         # 客户端格式：{ trade_id, body: { trade_id, seller_pubkey, content_hash, timestamp }, signature }
         body = data["body"]
+        if not isinstance(body, dict):
+            raise HTTPException(status_code=400, detail="Invalid field: body")
         trade_id = data.get("trade_id") or body.get("trade_id")
         content_hash = body.get("content_hash")
         seller_pubkey = body.get("seller_pubkey")
@@ -117,38 +196,37 @@ async def create_trade(request: Request):
         trade_id = data.get("trade_id")
         content_hash = data.get("content_hash")
         seller_pubkey = data.get("seller_pubkey")
+        description = data.get("description")
+        price = data.get("price")
         signature = data.get("signature")
 
-    required_fields = {
-        "trade_id": trade_id,
-        "content_hash": content_hash,
-        "seller_pubkey": seller_pubkey,
-        "signature": signature,
-    }
-
-    for field, value in required_fields.items():
-        if value is None:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Missing field: {field}",
-            )
-
-    try:
-        block = verify_create(
-            trade_id=trade_id,
-            content_hash=content_hash,
-            seller_pubkey=seller_pubkey,
-            description=description,
-            price=price,
-            signature=signature,
-        )
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-    # 合法才写链
-    apply_block(block)
-
-    return {"status": "ok"}
+    _check_fields(
+        {
+            "trade_id": trade_id,
+            "content_hash": content_hash,
+            "seller_pubkey": seller_pubkey,
+            "signature": signature,
+            "description": description,
+            "price": price,
+        },
+        ("trade_id", "content_hash", "seller_pubkey", "signature"),
+        # description / price 会写进区块和 trades 表，写链前就拒绝非字符串
+        # （前端总是以字符串提交），避免区块已写入而 insert_trade 失败
+        optional=("description", "price"),
+    )
+
+    await run_in_threadpool(
+        _verify_and_apply,
+        verify_create,
+        trade_id=trade_id,
+        content_hash=content_hash,
+        seller_pubkey=seller_pubkey,
+        description=description,
+        price=price,
+        signature=signature,
+    )
+
+    return _DirectJSONResponse({"status": "ok"})
 
 
 
@@ -168,38 +246,27 @@ async def complete_trade(request: Request):
     """
 
     try:
-        data = await request.json()
+        data = await _read_json(request)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid JSON")
 
-    required_fields = [
-        "trade_id",
-        "hash",
-        "sig_seller",
-        "sig_buyer",
-    ]
-
-    for field in required_fields:
-        if field not in data:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Missing field: {field}",
-            )
+    _check_fields(
+        data,
+        ("trade_id", "hash", "sig_seller", "sig_buyer"),
+        optional=("buyer_pubkey",),
+    )
 
-    try:
-        block = verify_complete(
-            trade_id=data["trade_id"],
-            complete_hash=data["hash"],
-            seller_sig=data["sig_seller"],
-            buyer_sig=data["sig_buyer"],
-            buyer_pubkey=data.get("buyer_pubkey"),
-        )
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    await run_in_threadpool(
+        _verify_and_apply,
+        verify_complete,
+        trade_id=data["trade_id"],
+        complete_hash=data["hash"],
+        seller_sig=data["sig_seller"],
+        buyer_sig=data["sig_buyer"],
+        buyer_pubkey=data.get("buyer_pubkey"),
+    )
 
-    apply_block(block)
-
-    return {"status": "ok"}
+    return _DirectJSONResponse({"status": "ok"})
 
 
 
@@ -218,35 +285,21 @@ async def cancel_trade(request: Request):
     """
 
     try:
-        data = await request.json()
+        data = await _read_json(request)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid JSON")
 
-    required_fields = [
-        "trade_id",
-        "hash",
-        "signature",
-    ]
+    _check_fields(data, ("trade_id", "hash", "signature"))
 
-    for field in required_fields:
-        if field not in data:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Missing field: {field}",
-            )
+    await run_in_threadpool(
+        _verify_and_apply,
+        verify_cancel,
+        trade_id=data["trade_id"],
+        cancel_hash=data["hash"],
+        seller_sig=data["signature"],
+    )
 
-    try:
-        block = verify_cancel(
-            trade_id=data["trade_id"],
-            cancel_hash=data["hash"],
-            seller_sig=data["signature"],
-        )
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-    apply_block(block)
-
-    return {"status": "ok"}
+    return _DirectJSONResponse({"status": "ok"})
 
 
 
@@ -256,38 +309,33 @@ async def cancel_trade(request: Request):
 
 
 @router.post("/{trade_id}/join")
-async def join_trade_api(trade_id: str, payload: dict):
+def join_trade_api(trade_id: str, payload: dict):
     """
     买家加入交易（写入 buyer_pubkey）
     """
     buyer_pubkey = payload.get("buyer_pubkey")
 
-    if not buyer_pubkey:
+    if not buyer_pubkey or not isinstance(buyer_pubkey, str):
         raise HTTPException(400, "buyer_pubkey required")
 
     # 简单的实现：只更新buyer_pubkey，不处理聊天密钥
     from db.trades import update_trade_join
-    try:
+    with _write_lock:
         update_trade_join(trade_id=trade_id, buyer_pubkey=buyer_pubkey, buyer_chat_pubkey={})
-        return {"ok": True}
-    except Exception as e:
-        raise HTTPException(500, str(e))
+    return _DirectJSONResponse({"ok": True})
 
 # 聊天相关API
 # ============================================================
 
 @router.get("/{trade_id}/chat-info")
-async def get_trade_chat_info_api(trade_id: str):
+def get_trade_chat_info_api(trade_id: str):
     """
     获取交易的聊天相关信息
     """
-    try:
-        chat_info = get_trade_chat_info(trade_id)
-        if not chat_info:
-            raise HTTPException(status_code=404, detail="Trade not found")
-        return chat_info
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    chat_info = get_trade_chat_info(trade_id)
+    if not chat_info:
+        raise HTTPException(status_code=404, detail="Trade not found")
+    return _DirectJSONResponse(chat_info)
 
 @router.post("/{trade_id}/update-chat-pubkey")
 async def update_chat_pubkey_api(trade_id: str, request: Request):
@@ -295,32 +343,27 @@ async def update_chat_pubkey_api(trade_id: str, request: Request):
     更新用户的聊天公钥
     """
     try:
-        data = await request.json()
+        data = await _read_json(request)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid JSON")
     
-    identity_pubkey = data.get("identity_pubkey")
-    chat_pubkey = data.get("chat_pubkey")
-    
-    if not identity_pubkey or not chat_pubkey:
-        raise HTTPException(400, "identity_pubkey and chat_pubkey required")
+    _check_fields(data, ("identity_pubkey", "chat_pubkey"))
+
+    identity_pubkey = data["identity_pubkey"]
+    chat_pubkey = data["chat_pubkey"]
     
-    try:
-        result = update_chat_pubkey(trade_id, identity_pubkey, chat_pubkey)
-        return result
-    except Exception as e:
-        raise HTTPException(500, str(e))
+    result = await run_in_threadpool(
+        _locked, update_chat_pubkey, trade_id, identity_pubkey, chat_pubkey
+    )
+    return _DirectJSONResponse(result)
 
 @router.get("/{trade_id}/peer-chat-pubkey/{identity_pubkey}")
-async def get_peer_chat_pubkey_api(trade_id: str, identity_pubkey: str):
+def get_peer_chat_pubkey_api(trade_id: str, identity_pubkey: str):
     """
     获取对方的聊天公钥
     """
-    try:
-        peer_chat_pubkey = get_peer_chat_pubkey(trade_id, identity_pubkey)
-        return {
-            "success": True,
-            "peer_chat_pubkey": peer_chat_pubkey
-        }
-    except Exception as e:
-        raise HTTPException(500, str(e))
+    peer_chat_pubkey = get_peer_chat_pubkey(trade_id, identity_pubkey)
+    return _DirectJSONResponse({
+        "success": True,
+        "peer_chat_pubkey": peer_chat_pubkey
+    })
@@ -1,11 +1,13 @@
 # app.py
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from api.trade_api import router as trade_router
 from api.chat_api import router as chat_ws_router, http_router as chat_http_router
 from api.block_api import router as block_router
+from services.trade_service import TradeValidationError
 
 def create_app():
     """
@@ -27,6 +29,7 @@ def create_app():
     
     # 直接在创建应用时注册路由，确保路由正确添加
     register_routes(app)
+    register_exception_handlers(app)
 
     return app
 
@@ -39,11 +42,22 @@ def register_routes(app):
     app.include_router(chat_http_router)
     app.include_router(block_router)
 
+async def _trade_validation_error(request: Request, exc: TradeValidationError):
+    """
+    交易校验失败 -> 400，响应格式与 HTTPException 相同
+    """
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+def register_exception_handlers(app):
+    """
+    业务异常统一转换为 HTTP 响应，接口里不再逐个 try / except
+    """
+    app.add_exception_handler(TradeValidationError, _trade_validation_error)
+
 if __name__ == "__main__":
     import uvicorn
 
     app = create_app()
-    register_routes(app)
 
     uvicorn.run(
         app,
@@ -52,10 +66,11 @@ if __name__ == "__main__":
         reload=True
     )
 else:
-    # 当作为模块导入时也要注册路由
+    # 当作为模块导入时创建应用（create_app 内已注册路由）
     app = create_app()
-    register_routes(app)
 
 
 #uvicorn app:app --reload
+#部署时：pip install uvloop httptools 后 uvicorn 会自动选用（--loop auto / --http auto），
+#也可显式指定：uvicorn app:app --loop uvloop --http httptools --ws websockets
 #python -m http.server 5500
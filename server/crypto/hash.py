@@ -2,9 +2,21 @@
 
 import json
 import hashlib
+from functools import lru_cache
 from typing import Any
 
 
+def canonical_json_bytes(obj: Any) -> bytes:
+    """
+    将 Python 对象序列化为“确定性 JSON”的 UTF-8 bytes
+
+    规则同 canonical_json；hash 的输入由它决定，
+    只用标准库 json（orjson 的浮点数格式与标准库不同，会改变 hash）
+    """
+
+    return canonical_json(obj).encode("utf-8")
+
+
 def canonical_json(obj: Any) -> str:
     """
     将 Python 对象序列化为“确定性 JSON 字符串”
@@ -33,7 +45,15 @@ def hash_object(obj: Any) -> str:
     返回 hex string
     """
 
-    canonical = canonical_json(obj)        #  规范化 JSON
-    data = canonical.encode("utf-8")       #  明确转为 bytes
-    digest = hashlib.sha256(data).hexdigest()  #  SHA-256
-    return digest
+    data = canonical_json_bytes(obj)    #  规范化 JSON（UTF-8 bytes）
+    return hash_bytes(data)             #  SHA-256
+
+
+@lru_cache(maxsize=4096)
+def hash_bytes(data: bytes) -> str:
+    """
+    对 bytes 进行 SHA-256 hash，返回 hex string
+
+    纯函数，按内容缓存：同步 / 校验时反复出现的相同 payload 直接命中
+    """
+    return hashlib.sha256(data).hexdigest()
@@ -16,18 +16,51 @@
 """
 
 import base64
+from functools import lru_cache
 from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
 from cryptography.exceptions import InvalidSignature
 
 
+# 前端格式的固定长度：SHA-256 hex、Base64 的 32 字节公钥 / 64 字节签名（带填充）
+_HASH_HEX_LEN = 64
+_PUBKEY_B64_LEN = 44
+_SIGNATURE_B64_LEN = 88
+
+
+def is_well_formed(pubkey, hash, signature) -> bool:
+    """
+    三个参数都是字符串且长度符合前端格式
+    在进入按字符串缓存的解码 / 验签之前检查，避免超长的客户端输入被缓存常驻内存
+    """
+    return (
+        isinstance(pubkey, str)
+        and isinstance(hash, str)
+        and isinstance(signature, str)
+        and len(pubkey) == _PUBKEY_B64_LEN
+        and len(hash) == _HASH_HEX_LEN
+        and len(signature) == _SIGNATURE_B64_LEN
+    )
+
+
 def _b64_to_bytes(data: str) -> bytes:
     return base64.b64decode(data.encode("utf-8"))
 
 
+@lru_cache(maxsize=4096)
 def _hex_to_bytes(data: str) -> bytes:
+    # 同一 hash 会被卖家 / 买家分别签名，解码结果按字符串缓存
     return bytes.fromhex(data)
 
 
+@lru_cache(maxsize=8192)
+def _load_pubkey(pubkey: str) -> Ed25519PublicKey:
+    """
+    Base64 公钥 -> Ed25519PublicKey，按公钥字符串缓存
+    （卖家 / 买家公钥反复出现，不必每次重新构造）
+    """
+    return Ed25519PublicKey.from_public_bytes(_b64_to_bytes(pubkey))
+
+
 def verify_signature(pubkey: str, hash: str, signature: str) -> bool:
     """
     验证：signature 是否是 pubkey 对 hash 的签名
@@ -37,12 +70,22 @@ def verify_signature(pubkey: str, hash: str, signature: str) -> bool:
     - hash: 十六进制字符串（crypto.js.hash 返回值）
     - signature: Base64 编码的签名（crypto.js.sign 返回值）
     """
+    if not is_well_formed(pubkey, hash, signature):
+        return False
+
+    return verify_signature_unchecked(pubkey, hash, signature)
+
+
+def verify_signature_unchecked(pubkey: str, hash: str, signature: str) -> bool:
+    """
+    同 verify_signature，但不做 is_well_formed 检查
+    （供已经检查过参数的调用方使用，例如在缓存之前先检查的 trade_service）
+    """
     try:
-        pk_bytes = _b64_to_bytes(pubkey)
         sig_bytes = _b64_to_bytes(signature)
         hash_bytes = _hex_to_bytes(hash)
 
-        pk = Ed25519PublicKey.from_public_bytes(pk_bytes)
+        pk = _load_pubkey(pubkey)
         pk.verify(sig_bytes, hash_bytes)
         return True
 
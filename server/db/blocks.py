@@ -3,32 +3,62 @@
 
 #sql命令以后要优化
 #1. 添加合适的索引
-#2. 分页查询优化（避免SELECT *）
+#2. 分页查询优化
 #3. 读写分离（如有需要）
 #4. 定期清理日志和优化表
 
 
-from db.mysql import get_cursor
+from db.mysql import get_cursor, get_streaming_cursor
+
+
+# SQL 语句（模块级常量，只构造一次）
+_SQL_INSERT_BLOCK = """
+INSERT INTO blocks (
+    block_index,
+    prev_hash,
+    block_hash,
+    timestamp,
+    type,
+    payload_json
+) VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+_SQL_GET_LAST_BLOCK = """
+SELECT block_index, prev_hash, block_hash, timestamp, type, payload_json
+FROM blocks
+ORDER BY block_index DESC
+LIMIT 1
+"""
+
+_SQL_GET_BLOCKS_SINCE = """
+SELECT block_index, prev_hash, block_hash, timestamp, type, payload_json
+FROM blocks
+WHERE block_index > %s
+ORDER BY block_index ASC
+"""
+
+_SQL_GET_BLOCKS_PAGE = """
+SELECT block_index, prev_hash, block_hash, timestamp, type, payload_json
+FROM blocks
+WHERE block_index > %s
+ORDER BY block_index ASC
+LIMIT %s
+"""
+
+_SQL_GET_ALL_BLOCK_PAYLOADS = """
+SELECT type, payload_json
+FROM blocks
+ORDER BY block_index ASC
+"""
 
 
 def insert_block(block: dict):
     """
     写入新区块（append-only）
     """
-    sql = """
-    INSERT INTO blocks (
-        block_index,
-        prev_hash,
-        block_hash,
-        timestamp,
-        type,
-        payload_json
-    ) VALUES (%s, %s, %s, %s, %s, %s)
-    """
-
     with get_cursor() as cursor:
         cursor.execute(
-            sql,
+            _SQL_INSERT_BLOCK,
             (
                 block["index"],
                 block["prev_hash"],
@@ -41,40 +71,35 @@ def insert_block(block: dict):
 
 
 def get_last_block():
-    sql = """
-    SELECT * FROM blocks
-    ORDER BY block_index DESC
-    LIMIT 1
-    """
-
-#sql命令是以后要优化的
-
     with get_cursor() as cursor:
-        cursor.execute(sql)
+        cursor.execute(_SQL_GET_LAST_BLOCK)
         return cursor.fetchone()
 
 
 def get_blocks_since(index: int):
-    sql = """
-    SELECT * FROM blocks
-    WHERE block_index > %s
-    ORDER BY block_index ASC
     """
-
+    获取 block_index > index 的区块（按 block_index 升序）
+    """
     with get_cursor() as cursor:
-        cursor.execute(sql, (index,))
+        cursor.execute(_SQL_GET_BLOCKS_SINCE, (index,))
         return cursor.fetchall()
 
 
-def get_all_blocks():
+def get_blocks_page(after_index: int, limit: int) -> list:
     """
-    获取所有区块（按 block_index 升序）
+    获取 block_index > after_index 的至多 limit 个区块（按 block_index 升序）
+    keyset 分页：每页单独借还连接，调用方在两页之间不占用连接
     """
-    sql = """
-    SELECT * FROM blocks
-    ORDER BY block_index ASC
-    """
-
     with get_cursor() as cursor:
-        cursor.execute(sql)
+        cursor.execute(_SQL_GET_BLOCKS_PAGE, (after_index, limit))
         return cursor.fetchall()
+
+
+def get_all_block_payloads():
+    """
+    逐行获取所有区块的 type / payload_json（按 block_index 升序，生成器）
+    只取重建状态需要的两列
+    """
+    with get_streaming_cursor() as cursor:
+        cursor.execute(_SQL_GET_ALL_BLOCK_PAYLOADS)
+        yield from cursor
@@ -0,0 +1,45 @@
+# db/cache.py
+
+#进程内短 TTL 读缓存：把高频重复读从 MySQL 往返变成内存查找
+#写操作必须主动 invalidate；TTL 只用来限制跨进程写入带来的陈旧时间
+
+
+import time
+from threading import Lock
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 10000, ttl: float = 1.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = {}
+        self._lock = Lock()
+
+    def get(self, key):
+        """
+        返回 (是否命中, 值)；过期条目视为未命中并移除
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return False, None
+            return True, value
+
+    def set(self, key, value):
+        with self._lock:
+            if key not in self._data and len(self._data) >= self.maxsize:
+                # 满了：丢掉最早写入的条目
+                del self._data[next(iter(self._data))]
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
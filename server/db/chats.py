@@ -1,78 +1,174 @@
+import time
+
 from db.mysql import get_cursor
 
-def insert_message(trade_id: str, buyer_chat_pubkey: str, sender_pubkey: str, ciphertext: str):
-    """
-    
+# SQL 语句（模块级常量，只构造一次）
+# 新表结构：含 buyer_chat_pubkey / sender_pubkey；旧表结构：只有 sender_chat_pubkey
+# INSERT 的 VALUES 里只能有 %s 占位符（timestamp 也作为参数传入），
+# pymysql 才会把 executemany 合并成一条多行 INSERT
+_SQL_INSERT_MESSAGE = """
+INSERT INTO chats (
+    trade_id,
+    buyer_chat_pubkey,
+    sender_pubkey,
+    ciphertext,
+    timestamp
+) VALUES (%s, %s, %s, %s, %s)
+"""
+
+_SQL_INSERT_MESSAGE_OLD = """
+INSERT INTO chats (
+    trade_id,
+    ciphertext,
+    timestamp,
+    sender_chat_pubkey
+) VALUES (%s, %s, %s, %s)
+"""
+
+_SQL_SELECT_MESSAGES = """
+SELECT
+    trade_id,
+    buyer_chat_pubkey,
+    sender_pubkey,
+    ciphertext,
+    timestamp
+FROM chats
+WHERE trade_id = %s
+"""
+
+_SQL_SELECT_MESSAGES_OLD = """
+SELECT
+    trade_id,
+    ciphertext,
+    timestamp,
+    sender_chat_pubkey
+FROM chats
+WHERE trade_id = %s
+"""
+
+# (trade_id) / (trade_id, after_ts) / (trade_id, after_ts, after_buyer_chat_pubkey) 三种翻页条件
+_SQL_GET_MESSAGES = _SQL_SELECT_MESSAGES + "ORDER BY timestamp ASC, buyer_chat_pubkey ASC LIMIT %s"
+_SQL_GET_MESSAGES_AFTER_TS = (
+    _SQL_SELECT_MESSAGES
+    + "AND timestamp > %s ORDER BY timestamp ASC, buyer_chat_pubkey ASC LIMIT %s"
+)
+_SQL_GET_MESSAGES_AFTER_KEY = (
+    _SQL_SELECT_MESSAGES
+    + "AND (timestamp, buyer_chat_pubkey) > (%s, %s) ORDER BY timestamp ASC, buyer_chat_pubkey ASC LIMIT %s"
+)
+_SQL_GET_MESSAGES_OLD = _SQL_SELECT_MESSAGES_OLD + "ORDER BY timestamp ASC LIMIT %s"
+_SQL_GET_MESSAGES_OLD_AFTER_TS = (
+    _SQL_SELECT_MESSAGES_OLD + "AND timestamp > %s ORDER BY timestamp ASC LIMIT %s"
+)
+
+# chats 表是否为新结构（含 buyer_chat_pubkey / sender_pubkey），None 表示尚未探测
+_chats_has_new_columns = None
+
+
+def _has_new_columns() -> bool:
     """
-    new_sql = """
-    INSERT INTO chats (
-        trade_id,
-        buyer_chat_pubkey,
-        sender_pubkey,
-        ciphertext,
-        timestamp
-    ) VALUES (%s, %s, %s, %s, UNIX_TIMESTAMP(NOW()))
+    探测一次 chats 表结构并缓存结果，之后每次读写直接选定 SQL
     """
-    old_sql = """
-    INSERT INTO chats (
-        trade_id,
-        ciphertext,
-        timestamp,
-        sender_chat_pubkey
-    ) VALUES (%s, %s, UNIX_TIMESTAMP(NOW()), %s)
+    global _chats_has_new_columns
+
+    if _chats_has_new_columns is None:
+        with get_cursor() as cursor:
+            cursor.execute("SHOW COLUMNS FROM chats")
+            columns = {row["Field"] for row in cursor.fetchall()}
+        _chats_has_new_columns = (
+            "buyer_chat_pubkey" in columns and "sender_pubkey" in columns
+        )
+
+    return _chats_has_new_columns
+
+
+def insert_message(trade_id: str, buyer_chat_pubkey: str, sender_pubkey: str, ciphertext: str, timestamp: int = None):
     """
 
-    with get_cursor() as cursor:
-        try:
-            cursor.execute(new_sql, (trade_id, buyer_chat_pubkey, sender_pubkey, ciphertext))
-        except Exception:
-            #  buyer_chat_pubkey / sender_pubkey
-            cursor.execute(old_sql, (trade_id, ciphertext, sender_pubkey))
+    """
+    if timestamp is None:
+        timestamp = int(time.time())
+    insert_messages([(trade_id, buyer_chat_pubkey, sender_pubkey, ciphertext, timestamp)])
 
-def get_messages(trade_id: str, limit: int = 100):
+def insert_messages(rows: list):
     """
-   
+    批量写入聊天消息（一条多行 INSERT，一次 commit）
+
+    整批失败时（例如同一会话同一秒内的两条消息主键冲突）逐条重试，
+    只丢掉真正写不进去的消息，不连累同批中其它交易的消息；
+    有消息最终没写进去时抛出异常
+
+    @param rows: [(trade_id, buyer_chat_pubkey, sender_pubkey, ciphertext, timestamp), ...]
     """
-    new_sql = """
-    SELECT 
-        trade_id,
-        buyer_chat_pubkey,
-        sender_pubkey,
-        ciphertext,
-        timestamp
-    FROM chats
-    WHERE trade_id = %s
-    ORDER BY timestamp ASC
-    LIMIT %s
+    if _has_new_columns():
+        sql = _SQL_INSERT_MESSAGE
+    else:
+        #  buyer_chat_pubkey / sender_pubkey
+        sql = _SQL_INSERT_MESSAGE_OLD
+        rows = [
+            (trade_id, ciphertext, timestamp, sender_pubkey)
+            for trade_id, _, sender_pubkey, ciphertext, timestamp in rows
+        ]
+
+    try:
+        with get_cursor() as cursor:
+            cursor.executemany(sql, rows)
+        return
+    except Exception:
+        if len(rows) == 1:
+            raise
+
+    failed = 0
+    error = None
+    for row in rows:
+        try:
+            with get_cursor() as cursor:
+                cursor.execute(sql, row)
+        except Exception as e:
+            failed += 1
+            error = e
+
+    if failed:
+        raise Exception(f"{failed}/{len(rows)} 条消息写入失败: {error}") from error
+
+def get_messages(trade_id: str, limit: int = 100, after_ts: int = None, after_buyer_chat_pubkey: str = None):
     """
-    old_sql = """
-    SELECT 
-        trade_id,
-        ciphertext,
-        timestamp,
-        sender_chat_pubkey
-    FROM chats
-    WHERE trade_id = %s
-    ORDER BY timestamp ASC
-    LIMIT %s
+    按 (timestamp, buyer_chat_pubkey) 升序获取聊天消息
+
+    翻页使用 keyset：传入上一页最后一条的 timestamp / buyer_chat_pubkey，
+    只返回其后的消息（走 idx_chats_trade_ts 索引，不需要 OFFSET）
     """
+    new_columns = _has_new_columns()
+
+    if new_columns:
+        if after_ts is not None and after_buyer_chat_pubkey is not None:
+            sql = _SQL_GET_MESSAGES_AFTER_KEY
+            params = (trade_id, after_ts, after_buyer_chat_pubkey, limit)
+        elif after_ts is not None:
+            sql = _SQL_GET_MESSAGES_AFTER_TS
+            params = (trade_id, after_ts, limit)
+        else:
+            sql = _SQL_GET_MESSAGES
+            params = (trade_id, limit)
+    else:
+        # 旧表结构没有 buyer_chat_pubkey，只能按 timestamp 翻页
+        if after_ts is not None:
+            sql = _SQL_GET_MESSAGES_OLD_AFTER_TS
+            params = (trade_id, after_ts, limit)
+        else:
+            sql = _SQL_GET_MESSAGES_OLD
+            params = (trade_id, limit)
 
     with get_cursor() as cursor:
-        try:
-            cursor.execute(new_sql, (trade_id, limit))
-            rows = cursor.fetchall()
-        except Exception:
-            cursor.execute(old_sql, (trade_id, limit))
-            rows = cursor.fetchall()
-
-    
-    normalized = []
-    for row in rows:
-        if "sender_pubkey" not in row and "sender_chat_pubkey" in row:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    if new_columns:
+        for row in rows:
+            row["id"] = None
+    else:
+        for row in rows:
             row["sender_pubkey"] = row.get("sender_chat_pubkey")
-        if "buyer_chat_pubkey" not in row:
             row["buyer_chat_pubkey"] = None
-        if "id" not in row:
             row["id"] = None
-        normalized.append(row)
-    return normalized
+    return list(rows)
@@ -4,8 +4,8 @@
 
 import pymysql
 from contextlib import contextmanager
-from threading import Lock
-from queue import Queue
+from threading import Semaphore
+from queue import SimpleQueue, Empty
 
 # 数据库配置
 DB_CONFIG = {
@@ -20,27 +20,32 @@ DB_CONFIG = {
 
 # 连接池
 connection_pool = None
-pool_lock = Lock()
 
 class ConnectionPool:
-    def __init__(self, max_connections=10):
+    def __init__(self, max_connections=10, timeout=5.0):
         self.max_connections = max_connections
-        self.pool = Queue(max_connections)
-        self.current_connections = 0
+        # 连接全部借出时最多等待的秒数（请求在线程池中并发执行，短暂排队是正常的）
+        self.timeout = timeout
+        self.pool = SimpleQueue()
+        # 信号量限制同时借出的连接数，取代外层锁
+        self.slots = Semaphore(max_connections)
         
     def get_connection(self):
-        with pool_lock:
-            if not self.pool.empty():
-                return self.pool.get()
-            elif self.current_connections < self.max_connections:
-                self.current_connections += 1
-                return self._create_connection()
-            else:
-                raise Exception("Connection pool exhausted")
+        if not self.slots.acquire(timeout=self.timeout):
+            raise Exception("Connection pool exhausted")
+        try:
+            return self.pool.get_nowait()
+        except Empty:
+            pass
+        try:
+            return self._create_connection()
+        except Exception:
+            self.slots.release()
+            raise
     
     def return_connection(self, conn):
-        with pool_lock:
-            self.pool.put(conn)
+        self.pool.put(conn)
+        self.slots.release()
     
     def _create_connection(self):
         return pymysql.connect(**DB_CONFIG)
@@ -83,4 +88,28 @@ def get_cursor():
     finally:
         if cursor:
             cursor.close()
-        close_connection(conn)
\ No newline at end of file
+        close_connection(conn)
+
+
+@contextmanager
+def get_streaming_cursor():
+    """
+    提供服务端游标（SSDictCursor）的上下文管理器
+    结果集逐行从服务器读取，不在客户端一次性缓存，用于大结果集的只读遍历
+    """
+    conn = get_connection()
+    cursor = None
+    try:
+        cursor = conn.cursor(pymysql.cursors.SSDictCursor)
+        yield cursor
+    finally:
+        try:
+            if cursor:
+                # 关闭时会读完剩余结果，之后连接才能执行其它命令
+                cursor.close()
+            # 只读遍历：无论正常结束、出错还是中途被放弃（生成器关闭），
+            # 都结束当前事务，避免把旧的一致性快照带回连接池
+            conn.rollback()
+        finally:
+            # close / rollback 失败（例如连接中途断开）也必须归还，否则信号量名额永久泄漏
+            close_connection(conn)
@@ -7,11 +7,19 @@
 import json
 import logging
 from db.mysql import get_cursor
+from db.cache import TTLCache
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# get_trade 的短 TTL 缓存（trade_id -> 行数据），本模块内的写操作负责失效
+_trade_cache = TTLCache(maxsize=10000, ttl=1.0)
+
+# list_trades / count_trades 的短 TTL 缓存（("list", limit, offset) / ("count",) -> 结果），
+# 任何改变列表内容的写操作整体清空
+_list_cache = TTLCache(maxsize=128, ttl=2.0)
+
 
 def insert_trade(trade: dict):
     """
@@ -58,6 +66,10 @@ def insert_trade(trade: dict):
             logger.error("交易插入失败: %s", error_msg)
             raise
 
+    # 提交后再失效缓存，避免并发读在提交前把旧值重新写回
+    _trade_cache.invalidate(trade["trade_id"])
+    _list_cache.clear()
+
 
 def update_trade_status(trade_id: str, status: str, buyer_pubkey: str = None):
     """
@@ -83,14 +95,24 @@ def update_trade_status(trade_id: str, status: str, buyer_pubkey: str = None):
         cursor.execute(sql, (status, buyer_pubkey, trade_id))
         logger.info("交易状态更新成功，影响行数: %s", cursor.rowcount)
 
+    _trade_cache.invalidate(trade_id)
+    _list_cache.clear()
+
 
-def get_trade(trade_id: str):
+def get_trade(trade_id: str, use_cache: bool = True):
     """
     获取交易详情
     
     @param trade_id: 交易ID
+    @param use_cache: False 时直接读库且不回填缓存；
+                      写锁内的状态机校验必须用 False（缓存可能被锁外的并发读回填成旧值）
     @return: 交易信息字典，如果不存在则返回None
     """
+    if use_cache:
+        hit, result = _trade_cache.get(trade_id)
+        if hit:
+            return result
+
     logger.info("获取交易详情，交易ID: %s", trade_id)
     
     sql = "SELECT * FROM trades WHERE trade_id = %s"
@@ -99,41 +121,70 @@ def get_trade(trade_id: str):
         cursor.execute(sql, (trade_id,))
         result = cursor.fetchone()
         logger.info("交易详情获取成功: %s", result is not None)
-        return result
+
+    if use_cache:
+        _trade_cache.set(trade_id, result)
+    return result
 
 
 def list_trades(limit: int = 50, offset: int = 0):
     """
-    获取交易列表
+    获取交易列表（短 TTL 缓存）
     
     @param limit: 返回的最大交易数量，默认50
     @param offset: 偏移量
-    @return: 交易列表
+    @return: 交易列表，created_at 已格式化为 ISO 字符串；
+             结果可能来自缓存并被多个请求共享，调用方不要修改
     """
+    key = ("list", limit, offset)
+    hit, result = _list_cache.get(key)
+    if hit:
+        return result
+
     logger.info("获取交易列表，限制: %s, 偏移: %s", limit, offset)
     
+    # 只取列表接口返回的列（按接口字段顺序），不读聊天公钥等大字段；
+    # created_at 在 SQL 中格式化为与 datetime.isoformat() 相同的字符串
     sql = """
-    SELECT * FROM trades
-    ORDER BY created_at DESC
+    SELECT
+        trade_id,
+        seller_pubkey,
+        buyer_pubkey,
+        status,
+        description,
+        price,
+        content_hash,
+        DATE_FORMAT(created_at, '%%Y-%%m-%%dT%%H:%%i:%%s') AS created_at
+    FROM trades
+    ORDER BY trades.created_at DESC
     LIMIT %s OFFSET %s
     """
 
     with get_cursor() as cursor:
         cursor.execute(sql, (limit, offset))
-        result = cursor.fetchall()
+        result = list(cursor.fetchall())
         logger.info("交易列表获取成功，数量: %s", len(result))
-        return result
+
+    _list_cache.set(key, result)
+    return result
 
 
 def count_trades() -> int:
     """
-    获取交易总数
+    获取交易总数（短 TTL 缓存）
     """
+    hit, total = _list_cache.get(("count",))
+    if hit:
+        return total
+
     sql = "SELECT COUNT(*) AS total FROM trades"
     with get_cursor() as cursor:
         cursor.execute(sql)
         row = cursor.fetchone() or {}
-        return int(row.get("total", 0))
+        total = int(row.get("total", 0))
+
+    _list_cache.set(("count",), total)
+    return total
 
 
 def clear_trades():
@@ -148,6 +199,79 @@ def clear_trades():
         cursor.execute(sql)
         logger.warning("交易表已清空，影响行数: %s", cursor.rowcount)
 
+    _trade_cache.clear()
+    _list_cache.clear()
+
+
+def _scalar(value):
+    """
+    链上 payload 的字段可能是任意 JSON（早期区块未校验类型）：
+    对象 / 数组转成 JSON 文本再写库，避免一个区块让整个重建事务回滚
+    """
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def rebuild_trades(trades: list, status_updates: list):
+    """
+    用区块回放结果整体重建交易表（单个事务）
+
+    @param trades: CREATE 区块对应的交易记录列表
+    @param status_updates: 按链上顺序排列的 (status, buyer_pubkey, trade_id) 列表
+    """
+    logger.warning(
+        "重建交易表，交易数: %s, 状态更新数: %s",
+        len(trades),
+        len(status_updates),
+    )
+
+    # VALUES 里只放 %s 占位符，pymysql 才会把 executemany 合并成多行 INSERT；
+    # created_at / updated_at 由表默认值 CURRENT_TIMESTAMP 填写
+    insert_sql = """
+    INSERT INTO trades (
+        trade_id,
+        seller_pubkey,
+        buyer_pubkey,
+        status,
+        content_hash,
+        description,
+        price
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """
+    update_sql = """
+    UPDATE trades
+    SET status = %s,
+        buyer_pubkey = COALESCE(%s, buyer_pubkey),
+        updated_at = NOW()
+    WHERE trade_id = %s
+    """
+
+    with get_cursor() as cursor:
+        cursor.execute("DELETE FROM trades")
+        if trades:
+            cursor.executemany(
+                insert_sql,
+                [
+                    (
+                        trade["trade_id"],
+                        trade["seller_pubkey"],
+                        trade.get("buyer_pubkey"),
+                        trade["status"],
+                        trade["content_hash"],
+                        _scalar(trade.get("description")),
+                        _scalar(trade.get("price")),
+                    )
+                    for trade in trades
+                ],
+            )
+        if status_updates:
+            cursor.executemany(update_sql, status_updates)
+        logger.warning("交易表重建完成")
+
+    _trade_cache.clear()
+    _list_cache.clear()
+
 
 def update_trade_join(trade_id: str, buyer_pubkey: str, buyer_chat_pubkey: dict):
     """
@@ -178,6 +302,9 @@ def update_trade_join(trade_id: str, buyer_pubkey: str, buyer_chat_pubkey: dict)
         )
         logger.info("买家加入交易更新成功，影响行数: %s", cursor.rowcount)
 
+    _trade_cache.invalidate(trade_id)
+    _list_cache.clear()
+
 
 def update_trade_chat_pubkey(
     trade_id: str,
@@ -218,6 +345,8 @@ def update_trade_chat_pubkey(
             cursor.execute(sql, (value, trade_id))
         logger.info("聊天公钥更新成功，影响行数: %s", cursor.rowcount)
 
+    _trade_cache.invalidate(trade_id)
+
 def get_trade_with_chat_info(trade_id: str):
     """
     获取包含聊天信息的交易详情
@@ -48,3 +48,6 @@ create table chats
     id                int         null,
     primary key (trade_id, buyer_chat_pubkey, timestamp)
 );
+
+create index idx_chats_trade_ts
+    on chats (trade_id, timestamp, buyer_chat_pubkey);
@@ -3,13 +3,24 @@
 import time
 import hashlib
 import json
+from threading import Lock
 
 from db.blocks import (
     get_last_block,
     insert_block,
-    get_all_blocks as db_get_all_blocks,
+    get_all_block_payloads,
 )
 
+_json_dumps = json.dumps
+
+# 最新区块缓存（内部格式）。blocks 表只经由 append_block 追加，
+# 写入成功后直接更新缓存，避免每次追加都回查数据库
+_last_block_cache = None
+
+# 追加区块时 “读最新区块 -> 计算 index / prev_hash -> 写入” 必须串行，
+# 否则线程池中并发的请求会算出同一高度
+_append_lock = Lock()
+
 
 # -----------------------------
 #  获取最新区块
@@ -17,14 +28,19 @@ from db.blocks import (
 
 def get_latest_block():
     """
-    返回链上的最后一个区块
+    返回链上的最后一个区块（优先读内存缓存）
     """
+    global _last_block_cache
+
+    if _last_block_cache is not None:
+        return _last_block_cache
+
     block = get_last_block()
     if block is None:
         return None
     
     # 转换数据库格式为内部格式
-    return {
+    _last_block_cache = {
         "index": block["block_index"],
         "prev_hash": block["prev_hash"],
         "hash": block["block_hash"],
@@ -32,23 +48,44 @@ def get_latest_block():
         "type": block["type"],
         "payload": json.loads(block["payload_json"]),
     }
+    return _last_block_cache
 
 
-def get_all_blocks():
+def invalidate_latest_block_cache():
     """
-    获取所有区块（用于 rebuild_state）
+    丢弃最新区块缓存，下次读取时回查数据库
     """
-    blocks = []
-    for block in db_get_all_blocks():
-        payload = json.loads(block["payload_json"])
-        blocks.append({
-            "type": block["type"],
-            "trade_id": payload["trade_id"],
-            "payload": payload["payload"],
-            "signatures": payload.get("signatures", {}),
-        })
-    
-    return blocks
+    global _last_block_cache
+    _last_block_cache = None
+
+
+def get_all_blocks_columns():
+    """
+    按列获取所有区块（用于 rebuild_state）
+
+    一次遍历填充 type / trade_id / payload / signatures 四列，
+    不为每个区块单独构造 dict
+    """
+    types = []
+    trade_ids = []
+    payloads = []
+    signatures = []
+    loads = json.loads
+
+    for block in get_all_block_payloads():
+        payload = loads(block["payload_json"])
+        types.append(block["type"])
+        trade_ids.append(payload["trade_id"])
+        payloads.append(payload["payload"])
+        signatures.append(payload.get("signatures", {}))
+
+    return {
+        "type": types,
+        "trade_id": trade_ids,
+        "payload": payloads,
+        "signatures": signatures,
+    }
+
 
 # -----------------------------
 #  计算区块 hash
@@ -57,15 +94,45 @@ def get_all_blocks():
 def compute_block_hash(block):
     """
     hash(index + prev_hash + payload + timestamp)
+
+    各字段依次喂给 hashlib（OpenSSL 后端），不再拼接整条字符串；
+    字节序列与拼接后的结果完全一致，已上链区块的 hash 不受影响
     """
-    block_string = (
-        str(block["index"]) +
-        block["prev_hash"] +
-        json.dumps(block["payload"], sort_keys=True) +
-        str(block["timestamp"])
+    return _hash_serialized_block(
+        block["index"],
+        block["prev_hash"],
+        _serialize_payload(block["payload"]),
+        block["timestamp"],
     )
 
-    return hashlib.sha256(block_string.encode()).hexdigest()
+
+def _serialize_payload(payload) -> str:
+    """
+    区块 payload 的规范化 JSON（即 hash 原像中的 payload 部分）
+    """
+    return _json_dumps(payload, sort_keys=True)
+
+
+def _hash_serialized_block(
+    index: int,
+    prev_hash: str,
+    payload_json: str,
+    timestamp: int,
+    _sha256=hashlib.sha256,
+) -> str:
+    """
+    对已序列化好的 payload 计算区块 hash，避免重复 json.dumps
+
+    字段顺序固定，sha256 / update 绑定为局部名，热路径上没有全局查找；
+    整数字段直接格式化为十进制 bytes，与 str(...).encode() 结果相同
+    """
+    h = _sha256()
+    update = h.update
+    update(b"%d" % index)
+    update(prev_hash.encode())
+    update(payload_json.encode())
+    update(b"%d" % timestamp)
+    return h.hexdigest()
 
 
 # -----------------------------
@@ -85,8 +152,21 @@ def append_block(block_data):
         "signatures": {...}
     }
     """
+    with _append_lock:
+        return _append_block(block_data)
+
+
+def _append_block(block_data):
+    """
+    append_block 的实现，调用方需持有 _append_lock
+    """
+    global _last_block_cache
+
     last_block = get_latest_block()
 
+    # 只取一次时间戳：参与 hash 的与写库的必须是同一个值
+    timestamp = int(time.time())
+
     if last_block is None:
         # 创世区块
         index = 0
@@ -103,29 +183,41 @@ def append_block(block_data):
         "signatures": block_data.get("signatures", {}),
     }
 
+    # payload 只序列化一次：既作为 hash 原像，也直接写入 payload_json
+    # （payload_json 是 MySQL JSON 列，入库后按内容存储，与文本格式无关）
+    payload_json = _serialize_payload(full_payload)
+
     # 计算区块 hash
-    block_for_hash = {
-        "index": index,
-        "prev_hash": prev_hash,
-        "payload": full_payload,
-        "timestamp": int(time.time())
-    }
-    block_hash = compute_block_hash(block_for_hash)
+    block_hash = _hash_serialized_block(index, prev_hash, payload_json, timestamp)
 
     # 构造要写入数据库的区块
     db_block = {
         "index": index,
         "prev_hash": prev_hash,
         "hash": block_hash,
-        "timestamp": int(time.time()),
+        "timestamp": timestamp,
         "type": block_data["type"],
-        "payload_json": json.dumps(full_payload, ensure_ascii=False),
+        "payload_json": payload_json,
     }
 
     #  prev_hash 必须对得上
     if last_block is not None and db_block["prev_hash"] != last_block["hash"]:
         raise Exception("Blockchain broken: prev_hash mismatch")
 
-    insert_block(db_block)
+    try:
+        insert_block(db_block)
+    except Exception:
+        # 写入失败（例如其他进程已追加了同一高度）：缓存可能已过期
+        invalidate_latest_block_cache()
+        raise
+
+    _last_block_cache = {
+        "index": index,
+        "prev_hash": prev_hash,
+        "hash": block_hash,
+        "timestamp": timestamp,
+        "type": block_data["type"],
+        "payload": full_payload,
+    }
 
     return db_block
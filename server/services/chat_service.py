@@ -1,10 +1,90 @@
 # backend/services/chat_service.py
 
-from typing import Dict, List, Tuple
-from db.chats import insert_message, get_messages
+import asyncio
+import json
+import logging
+import time
+from typing import Dict
+from db.chats import insert_messages, get_messages
 
-# 房间管理: trade_id -> list of (connection, identity_pubkey, chat_pubkey)
-_rooms: Dict[str, List[Tuple]] = {}
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖，未安装时只走标准库 json
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+_time = time.time
+
+
+def dumps_message(message: dict) -> str:
+    """
+    把消息编码为 WebSocket 文本帧（紧凑格式，不转义非 ASCII 字符，与 send_json 一致）
+
+    安装了 orjson 时优先用它编码；orjson 不支持的输入回退到标准库
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(message).decode("utf-8")
+        except orjson.JSONEncodeError:
+            pass
+
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def loads_message(data: str):
+    """
+    解码 WebSocket 收到的文本帧
+
+    安装了 orjson 时优先用它解码；orjson 拒绝而标准库接受的输入
+    （NaN / Infinity、未配对的代理项转义、BOM 等）回退到 json.loads，结果与原先一致
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+
+    return json.loads(data)
+
+
+class _Member:
+    """
+    聊天室中的一个连接（固定字段，用 __slots__ 省去实例 __dict__）
+    """
+
+    __slots__ = ("conn", "identity", "chat")
+
+    def __init__(self, conn, identity: str, chat: str = None):
+        self.conn = conn
+        self.identity = identity
+        self.chat = chat
+
+
+# 房间管理: trade_id -> {id(connection): _Member}
+_rooms: Dict[str, Dict[int, _Member]] = {}
+
+# 待落库的聊天消息：短时间窗口内的消息合并为一次批量写入
+_pending_messages = []
+_flush_handle = None
+_FLUSH_DELAY = 0.01     # 秒
+_FLUSH_SIZE = 64
+
+# 消息模板：每次 copy() 后只填写可变字段（比逐次构造字面量 dict 更省）
+_JOIN_TEMPLATE = {
+    "type": "JOIN",
+    "trade_id": None,
+    "identity_pubkey": None,
+    "chat_pubkey": None,
+    "timestamp": 0,
+}
+_CHAT_TEMPLATE = {
+    "type": "CHAT",
+    "trade_id": None,
+    "sender_chat_pubkey": None,
+    "ciphertext": None,
+    "timestamp": 0,
+}
 
 # -----------------------------
 # 加入聊天室
@@ -14,17 +94,17 @@ async def join_room(trade_id: str, conn, identity_pubkey: str, chat_pubkey: str
     """
     将一个连接加入指定 trade_id 的聊天室
     """
-    if trade_id not in _rooms:
-        _rooms[trade_id] = []
-    
-    # 检查是否已经存在相同的连接
-    for i, (existing_conn, existing_identity, existing_chat) in enumerate(_rooms[trade_id]):
-        if existing_conn == conn:
-            # 更新现有连接的信息
-            _rooms[trade_id][i] = (conn, identity_pubkey, chat_pubkey)
-            return
-    
-    _rooms[trade_id].append((conn, identity_pubkey, chat_pubkey))
+    room = _rooms.setdefault(trade_id, {})
+    key = id(conn)
+
+    # 已存在相同的连接：只更新连接信息
+    member = room.get(key)
+    if member is not None:
+        member.identity = identity_pubkey
+        member.chat = chat_pubkey
+        return
+
+    room[key] = _Member(conn, identity_pubkey, chat_pubkey)
     
     # 向房间内的其他人广播 JOIN 消息
     await broadcast_join(trade_id, identity_pubkey, chat_pubkey)
@@ -37,17 +117,14 @@ def leave_room(trade_id: str, conn):
     """
     将一个连接从聊天室中移除
     """
-    if trade_id not in _rooms:
+    room = _rooms.get(trade_id)
+    if room is None:
         return
-    
-    # 查找并移除匹配的连接
-    _rooms[trade_id] = [
-        item for item in _rooms[trade_id]
-        if item[0] != conn
-    ]
-    
+
+    room.pop(id(conn), None)
+
     # 如果房间空了，清理掉
-    if not _rooms[trade_id]:
+    if not room:
         del _rooms[trade_id]
 
 # -----------------------------
@@ -61,19 +138,13 @@ async def broadcast_join(trade_id: str, identity_pubkey: str, chat_pubkey: str =
     if trade_id not in _rooms:
         return
     
-    join_message = {
-        "type": "JOIN",
-        "trade_id": trade_id,
-        "identity_pubkey": identity_pubkey,
-        "chat_pubkey": chat_pubkey,
-        "timestamp": get_current_timestamp()
-    }
+    join_message = _JOIN_TEMPLATE.copy()
+    join_message["trade_id"] = trade_id
+    join_message["identity_pubkey"] = identity_pubkey
+    join_message["chat_pubkey"] = chat_pubkey
+    join_message["timestamp"] = get_current_timestamp()
     
-    for conn, _, _ in _rooms[trade_id]:
-        try:
-            await conn.send_json(join_message)
-        except Exception:
-            pass
+    await _broadcast(trade_id, join_message)
 
 # -----------------------------
 # 中继密文消息
@@ -87,34 +158,89 @@ async def relay(trade_id: str, ciphertext: str, sender_chat_pubkey: str, buyer_c
     if trade_id not in _rooms:
         return
     
-    # 保存消息到数据库
-    try:
-        # 存储发送者身份公钥，用于前端识别消息发送者
-        insert_message(trade_id, buyer_chat_pubkey, sender_chat_pubkey, ciphertext)
-    except Exception as e:
-        print(f"[chat_service] 保存消息失败: {e}")
+    timestamp = get_current_timestamp()
+
+    # 保存消息到数据库（进入批量缓冲，广播不等待落库）
+    # 存储发送者身份公钥，用于前端识别消息发送者；落库时间与广播时间一致
+    _queue_message((trade_id, buyer_chat_pubkey, sender_chat_pubkey, ciphertext, timestamp))
     
     # 构建消息
-    message = {
-        "type": "CHAT",
-        "trade_id": trade_id,
-        "sender_chat_pubkey": sender_chat_pubkey,
-        "ciphertext": ciphertext,
-        "timestamp": get_current_timestamp()
-    }
-    
-    dead_conns = []
-    
-    # 广播给房间内的所有连接
-    for conn, _, _ in _rooms[trade_id]:
-        try:
-            await conn.send_json(message)
-        except Exception:
-            dead_conns.append(conn)
+    message = _CHAT_TEMPLATE.copy()
+    message["trade_id"] = trade_id
+    message["sender_chat_pubkey"] = sender_chat_pubkey
+    message["ciphertext"] = ciphertext
+    message["timestamp"] = timestamp
     
+    await _broadcast(trade_id, message)
+
+def _queue_message(row: tuple):
+    """
+    把一条消息放入落库缓冲：攒满 _FLUSH_SIZE 条立即写，否则 _FLUSH_DELAY 后写
+    """
+    global _flush_handle
+
+    _pending_messages.append(row)
+
+    if len(_pending_messages) >= _FLUSH_SIZE:
+        _flush_messages()
+    elif _flush_handle is None:
+        _flush_handle = asyncio.get_running_loop().call_later(_FLUSH_DELAY, _flush_messages)
+
+def _flush_messages():
+    """
+    把缓冲中的消息交给线程池批量写库（同步 DB 调用不阻塞事件循环）
+    """
+    global _pending_messages, _flush_handle
+
+    if _flush_handle is not None:
+        _flush_handle.cancel()
+        _flush_handle = None
+
+    if not _pending_messages:
+        return
+
+    rows = _pending_messages
+    _pending_messages = []
+
+    saving = asyncio.get_running_loop().run_in_executor(None, insert_messages, rows)
+    saving.add_done_callback(_report_save_failure)
+
+def _report_save_failure(saving):
+    """
+    后台落库完成后的回调：只记录失败
+    """
+    if saving.cancelled():
+        return
+    e = saving.exception()
+    if e is not None:
+        logger.error("保存消息失败: %s", e)
+
+# -----------------------------
+# 房间内广播
+# -----------------------------
+
+async def _broadcast(trade_id: str, message: dict):
+    """
+    并发地把消息发给房间内的所有连接，发送失败的连接移出房间
+
+    消息只序列化一次（与 WebSocket.send_json 的编码方式一致），
+    所有连接复用同一份文本帧
+    """
+    room = _rooms.get(trade_id)
+    if not room:
+        return
+
+    text = dumps_message(message)
+    conns = [member.conn for member in room.values()]
+    results = await asyncio.gather(
+        *(conn.send_text(text) for conn in conns),
+        return_exceptions=True,
+    )
+
     # 清理失效连接
-    for conn in dead_conns:
-        leave_room(trade_id, conn)
+    for conn, result in zip(conns, results):
+        if isinstance(result, Exception):
+            leave_room(trade_id, conn)
 
 # -----------------------------
 # 获取房间信息
@@ -129,22 +255,22 @@ def get_room_info(trade_id: str):
     
     return [
         {
-            "identity_pubkey": identity_pubkey,
-            "chat_pubkey": chat_pubkey,
+            "identity_pubkey": member.identity,
+            "chat_pubkey": member.chat,
             "connected": True
         }
-        for _, identity_pubkey, chat_pubkey in _rooms[trade_id]
+        for member in _rooms[trade_id].values()
     ]
 
 # -----------------------------
 # 获取历史消息
 # -----------------------------
 
-def get_chat_history(trade_id: str, limit: int = 100):
+def get_chat_history(trade_id: str, limit: int = 100, after_ts: int = None, after_buyer_chat_pubkey: str = None):
     """
-    获取聊天历史
+    获取聊天历史（after_ts / after_buyer_chat_pubkey 为上一页最后一条消息）
     """
-    return get_messages(trade_id, limit)
+    return get_messages(trade_id, limit, after_ts, after_buyer_chat_pubkey)
 
 # -----------------------------
 # 工具函数
@@ -154,5 +280,4 @@ def get_current_timestamp():
     """
     获取当前时间戳
     """
-    import time
-    return int(time.time())
+    return int(_time())
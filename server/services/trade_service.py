@@ -10,9 +10,11 @@
  后端只做 verify + state machine
 """
 
-from crypto.verify import verify_signature
+from functools import lru_cache
+
+from crypto.verify import verify_signature_unchecked, is_well_formed
 from crypto.hash import hash_object, canonical_json
-from services.blockchain import append_block
+from services.blockchain import append_block, get_all_blocks_columns
 
 from db.trades import (
     get_trade,
@@ -22,7 +24,23 @@ from db.trades import (
     update_trade_join,
 )
 
-from db.blocks import get_all_blocks
+class TradeValidationError(Exception):
+    """
+    请求本身不合法（交易不存在 / 状态不对 / 签名无效等），由 app 统一转为 400
+    """
+
+
+# 验签结果只取决于 (pubkey, hash, signature)，重试 / 重放时直接命中缓存
+_verify_cached = lru_cache(maxsize=4096)(verify_signature_unchecked)
+
+
+def _verify(pubkey, hash, signature) -> bool:
+    """
+    格式不对的参数直接判为无效，不进缓存（缓存键是客户端原样传来的字符串）
+    """
+    if not is_well_formed(pubkey, hash, signature):
+        return False
+    return _verify_cached(pubkey=pubkey, hash=hash, signature=signature)
 
 # ============================================================
 #  CREATE —— 创建交易
@@ -38,16 +56,16 @@ def verify_create(trade_id: str, content_hash: str, seller_pubkey: str, signatur
     """
 
     # 1. trade_id 必须唯一
-    if get_trade(trade_id):
-        raise Exception("Trade already exists")
+    if get_trade(trade_id, use_cache=False):
+        raise TradeValidationError("Trade already exists")
 
     # 2. 验证卖家签名（签名对象就是 trade_id）
-    if not verify_signature(
+    if not _verify(
         pubkey=seller_pubkey,
         hash=trade_id,
         signature=signature,
     ):
-        raise Exception("Invalid seller signature")
+        raise TradeValidationError("Invalid seller signature")
 
     # 3. 构造 CREATE 区块（不写状态）
     block = {
@@ -82,35 +100,35 @@ def verify_complete(
     验证完成交易是否合法（双签）
     支持前端显式传 buyer_pubkey，避免多买家并发时签名归属错位。
     """
-    trade = get_trade(trade_id)
+    trade = get_trade(trade_id, use_cache=False)
     if trade is None:
-        raise Exception("Trade not found")
+        raise TradeValidationError("Trade not found")
 
     if trade["status"] != "OPEN":
-        raise Exception("Trade is not open")
+        raise TradeValidationError("Trade is not open")
 
     seller_pubkey = trade["seller_pubkey"]
     target_buyer_pubkey = buyer_pubkey or trade.get("buyer_pubkey")
 
     if not target_buyer_pubkey:
-        raise Exception("Buyer pubkey not set")
+        raise TradeValidationError("Buyer pubkey not set")
 
     if target_buyer_pubkey == seller_pubkey:
-        raise Exception("Invalid trade participants")
+        raise TradeValidationError("Invalid trade participants")
 
-    if not verify_signature(
+    if not _verify(
         pubkey=seller_pubkey,
         hash=complete_hash,
         signature=seller_sig,
     ):
-        raise Exception("Invalid seller signature")
+        raise TradeValidationError("Invalid seller signature")
 
-    if not verify_signature(
+    if not _verify(
         pubkey=target_buyer_pubkey,
         hash=complete_hash,
         signature=buyer_sig,
     ):
-        raise Exception("Invalid buyer signature")
+        raise TradeValidationError("Invalid buyer signature")
 
     block = {
         "type": "COMPLETE",
@@ -145,23 +163,23 @@ def verify_cancel(
     验证取消交易是否合法
     """
 
-    trade = get_trade(trade_id)
+    trade = get_trade(trade_id, use_cache=False)
     if trade is None:
-        raise Exception("Trade not found")
+        raise TradeValidationError("Trade not found")
 
     # 1. 状态机检查
     if trade["status"] != "OPEN":
-        raise Exception("Trade is not open")
+        raise TradeValidationError("Trade is not open")
 
     seller_pubkey = trade["seller_pubkey"]
 
     # 2. 只有卖家可以取消
-    if not verify_signature(
+    if not _verify(
         pubkey=seller_pubkey,
         hash=cancel_hash,
         signature=seller_sig,
     ):
-        raise Exception("Invalid seller signature")
+        raise TradeValidationError("Invalid seller signature")
 
     # 3. 构造相同的body结构来验证hash一致性
     #import time
@@ -235,28 +253,39 @@ def rebuild_state():
      重要：
     - 只更新 trades
     - 绝不重新 append_block
+
+    先遍历整条链收集 CREATE 与状态变更，再在一个事务里批量写入
     """
-    from db.trades import clear_trades
+    from db.trades import rebuild_trades
 
-    clear_trades()
+    # 先一次性读出并解码整条链（按列），再按顺序回放
+    columns = get_all_blocks_columns()
 
-    for block in get_all_blocks():
-        block_type = block["type"]
-        trade_id = block["trade_id"]
+    trades = []
+    status_updates = []
 
+    for block_type, trade_id, payload in zip(
+        columns["type"],
+        columns["trade_id"],
+        columns["payload"],
+    ):
         if block_type == "CREATE":
-            insert_trade({
+            trades.append({
                 "trade_id": trade_id,
-                "seller_pubkey": block["payload"]["seller_pubkey"],
-                "content_hash": block["payload"]["content_hash"],
+                "seller_pubkey": payload["seller_pubkey"],
+                "content_hash": payload["content_hash"],
+                "description": payload.get("description"),
+                "price": payload.get("price"),
                 "status": "OPEN",
             })
 
         elif block_type == "COMPLETE":
-            update_trade_status(trade_id, "COMPLETED")
+            status_updates.append(("COMPLETED", payload.get("buyer_pubkey"), trade_id))
 
         elif block_type == "CANCEL":
-            update_trade_status(trade_id, "CANCELLED")
+            status_updates.append(("CANCELLED", None, trade_id))
+
+    rebuild_trades(trades, status_updates)
 
 
 def join_trade(trade_id: str, buyer_pubkey: str, buyer_chat_pubkey: dict = None):
@@ -321,9 +350,9 @@ def update_chat_pubkey(trade_id: str, identity_pubkey: str, chat_pubkey: str):
     3) 若 buyer_pubkey 为空，允许当前 identity 占位为买家并写入 chat pubkey
     4) 非参与者不抛异常（避免前端初始化直接 500），返回 ignored
     """
-    trade = get_trade(trade_id)
+    trade = get_trade(trade_id, use_cache=False)
     if trade is None:
-        raise Exception("Trade not found")
+        raise TradeValidationError("Trade not found")
 
     # 卖家更新
     if trade["seller_pubkey"] == identity_pubkey: